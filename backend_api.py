@@ -1,48 +1,134 @@
 import os
 import re
-import base64
-from typing import TypedDict, List, Optional
+import asyncio
+import struct
+import hashlib
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypedDict, List, Optional, Tuple
 import uvicorn
 from dotenv import load_dotenv
 import torch
 import soundfile as sf
 import numpy as np
-import requests
+import httpx
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from transformers import AutoProcessor, BarkModel
+from transformers import AutoProcessor, BarkModel, BitsAndBytesConfig
+from transformers.utils import is_flash_attn_2_available
 import google.generativeai as genai
 
 # --- 1. PROJECT SETUP & CONFIGURATION ---
 
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+gemini_model = None  # one shared client for every script request
 if GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
+    gemini_model = genai.GenerativeModel('gemini-1.5-flash')
 else:
     print("WARNING: Gemini API key not found. Script generation will fail.")
+# Optional; authenticated GitHub requests get 5000/hr instead of 60/hr.
+GH_TOKEN = os.getenv("GH_TOKEN")
 
 # --- 2. TTS MODEL LOADING & CONFIGURATION ---
 
+# With Bark on the GPU, extra intra-op CPU threads only contend with each other
+# and the event loop; on CPU-only machines keep PyTorch's default so inference stays usable.
+if torch.cuda.is_available():
+    torch.set_num_threads(1)
+
 processor = None
 model = None
+voice_prompt = None  # VOICE_PRESET history prompt, loaded once and kept on the model's device
+copy_stream = None  # CUDA stream for device-to-host audio copies, so they overlap with generation
+
+VOICE_PRESET = "v2/en_speaker_6"
+# Upper bound on chunks per model.generate call; tune to available VRAM.
+BARK_MAX_BATCH = int(os.getenv("BARK_MAX_BATCH", "4"))
+# How long the batch worker waits for more chunks before running a partial batch.
+BARK_MAX_BATCH_DELAY = 0.05
+bark_queue: Optional[asyncio.Queue] = None  # created on startup, inside the server's event loop
+tts_model_ready: Optional[asyncio.Event] = None  # set once the background Bark load has finished
+# Compile the Bark sub-models with CUDA graphs on GPU; opt-in (BARK_COMPILE=1) until a
+# speedup has been measured, since decode shapes vary per token and per batch size.
+BARK_COMPILE = os.getenv("BARK_COMPILE", "0") == "1"
+# Model loading, warm-up and every generate call run on this one thread: CUDA-graph
+# trees are thread-local, so graphs captured on one thread are unusable on another.
+bark_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bark")
+# Weight precision for Bark: float16 (default), bfloat16, float32, or int8
+# (weight-only, needs a GPU plus the optional bitsandbytes package).
+BARK_DTYPE = os.getenv("BARK_DTYPE", "float16")
+BARK_TORCH_DTYPES = {"float16": torch.float16, "bfloat16": torch.bfloat16, "float32": torch.float32}
+
+def pick_attn_implementation() -> str:
+    """
+    Chooses the attention kernel for Bark: BARK_ATTN_IMPLEMENTATION if set,
+    otherwise Flash-Attention-2 when it is installed, a GPU is present and the
+    weights are half precision (the flash kernels reject float32).
+    """
+    requested = os.getenv("BARK_ATTN_IMPLEMENTATION")
+    if requested:
+        return requested
+    if BARK_DTYPE in ("float16", "bfloat16", "int8") and torch.cuda.is_available() and is_flash_attn_2_available():
+        return "flash_attention_2"
+    return "eager"
+
+def bark_load_kwargs() -> dict:
+    """
+    Builds the BarkModel.from_pretrained precision arguments for BARK_DTYPE.
+    """
+    if BARK_DTYPE == "int8":
+        # Only the transformer Linear layers are quantized; output heads stay in fp16.
+        quantization_config = BitsAndBytesConfig(load_in_8bit=True, llm_int8_skip_modules=["lm_head", "lm_heads"])
+        return {"torch_dtype": torch.float16, "quantization_config": quantization_config, "device_map": "cuda"}
+    if BARK_DTYPE not in BARK_TORCH_DTYPES:
+        raise ValueError(f"Unsupported BARK_DTYPE '{BARK_DTYPE}'.")
+    return {"torch_dtype": BARK_TORCH_DTYPES[BARK_DTYPE]}
+
+def compile_bark_submodels():
+    """
+    Wraps the forward pass of each Bark sub-model in torch.compile and runs one
+    short warm-up generation so graphs are captured before the first request.
+    """
+    print("Compiling Bark sub-models with torch.compile (reduce-overhead)...")
+    for submodel in (model.semantic, model.coarse_acoustics, model.fine_acoustics):
+        # Compile forward rather than replacing the module: generate() calls self(...)
+        # on the original sub-model, so a wrapped module would never be used.
+        submodel.forward = torch.compile(submodel.forward, mode="reduce-overhead", fullgraph=False)
+    collect_audio_batch(*generate_audio_batch(tokenize_chunks(["Warming up."])))
+    print("✅ Bark sub-models compiled.")
 
 def load_tts_model():
-    global processor, model
+    global processor, model, voice_prompt, copy_stream
     print("Loading local TTS model (Suno's Bark)... This may take a few minutes.")
     model_id = "suno/bark"
     try:
         processor = AutoProcessor.from_pretrained(model_id)
-        model = BarkModel.from_pretrained(model_id, torch_dtype=torch.float16)
+        attn_implementation = pick_attn_implementation()
+        print(f"Using '{attn_implementation}' attention and {BARK_DTYPE} weights for Bark.")
+        model = BarkModel.from_pretrained(model_id, attn_implementation=attn_implementation, **bark_load_kwargs())
         if torch.cuda.is_available():
             print("CUDA (GPU) detected. Moving model to GPU for faster performance.")
-            model = model.to("cuda")
+            if BARK_DTYPE != "int8":  # int8 weights are already placed on the GPU by bitsandbytes
+                model = model.to("cuda")
+            copy_stream = torch.cuda.Stream()
         else:
             print("No CUDA (GPU) detected. Model will run on CPU, which will be slow.")
+        # The voice preset is the same for every chunk, so load and encode it only once.
+        # truncation=True matches tokenize_chunks: the fast tokenizer is shared across
+        # threads and fails with "Already borrowed" if its truncation settings change.
+        voice_prompt = processor(" ", voice_preset=VOICE_PRESET, return_tensors="pt", truncation=True)["history_prompt"].to(model.device)
+        if torch.cuda.is_available() and BARK_COMPILE and BARK_DTYPE != "int8":
+            compile_bark_submodels()
         print("✅ TTS Model loaded successfully.")
     except Exception as e:
+        # Never leave a half-initialised model behind for the audio endpoints to use
+        processor = model = voice_prompt = copy_stream = None
         print(f"❌ Failed to load TTS model: {e}")
 
 # --- 3. DATA MODELS FOR API REQUESTS ---
@@ -56,6 +142,14 @@ class AudioRequest(BaseModel):
 
 # --- 4. HELPER FUNCTIONS ---
 
+# Patterns used on every audio request, compiled once at import time.
+_MD_BOLD = re.compile(r'\*\*(.*?)\*\*|\*(.*?)\*')
+_MD_HEAD = re.compile(r'#+\s.*')
+_PARENS = re.compile(r'\(.*?\)')
+_SPEAKER = re.compile(r'^\w+:', re.MULTILINE)
+_NEWLINES = re.compile(r'\n+')
+_SENT_SPLIT = re.compile(r'(?<=[.?!])\s+')
+
 def clean_script_for_tts(script: str) -> str:
     """
     Removes markdown, speaker notes, and other non-speech artifacts to prepare
@@ -63,15 +157,15 @@ def clean_script_for_tts(script: str) -> str:
     """
     print("Cleaning script for TTS...")
     # Remove markdown like **text** or *text*
-    script = re.sub(r'\*\*(.*?)\*\*|\*(.*?)\*', r'\1\2', script)
+    script = _MD_BOLD.sub(r'\1\2', script)
     # Remove markdown headings like ## Title
-    script = re.sub(r'#+\s.*', '', script)
+    script = _MD_HEAD.sub('', script)
     # Remove speaker notes in parentheses, e.g., (upbeat music)
-    script = re.sub(r'\(.*?\)', '', script)
+    script = _PARENS.sub('', script)
     # Remove labels like "Speaker:", "Intro:", "Outro:", etc.
-    script = re.sub(r'^\w+:', '', script, flags=re.MULTILINE)
+    script = _SPEAKER.sub('', script)
     # Replace multiple newlines with a single space
-    script = re.sub(r'\n+', ' ', script)
+    script = _NEWLINES.sub(' ', script)
     # Remove any remaining standalone asterisks or dashes
     script = script.replace('*', '').replace('-', '')
     # Trim whitespace from the start and end
@@ -84,15 +178,19 @@ def text_chunker_for_bark(text: str, max_chars=300): # Reduced max_chars for mor
     Splits text into smaller, sentence-aware chunks for the Bark model,
     enforcing a hard character limit to prevent model errors.
     """
-    sentences = re.split(r'(?<=[.?!])\s+', text.replace("\n", " "))
-    chunks, current_chunk = [], ""
+    sentences = _SENT_SPLIT.split(text.replace("\n", " "))
+    # Collect sentences in a list and join once per chunk to avoid repeated string concatenation
+    chunks, current, current_len = [], [], 0
     for sentence in sentences:
-        if len(current_chunk) + len(sentence) + 1 > max_chars:
-            if current_chunk: chunks.append(current_chunk)
-            current_chunk = sentence
+        if not sentence:
+            continue
+        if current and current_len + len(sentence) + 1 > max_chars:
+            chunks.append(" ".join(current))
+            current, current_len = [sentence], len(sentence)
         else:
-            current_chunk += (" " + sentence) if current_chunk else sentence
-    if current_chunk: chunks.append(current_chunk)
+            current_len += len(sentence) + 1 if current else len(sentence)
+            current.append(sentence)
+    if current: chunks.append(" ".join(current))
     
     final_chunks = []
     for chunk in chunks:
@@ -102,11 +200,265 @@ def text_chunker_for_bark(text: str, max_chars=300): # Reduced max_chars for mor
             final_chunks.append(chunk)
     return [c.strip() for c in final_chunks if c.strip()]
 
-# --- 5. CORE AI LOGIC FUNCTIONS (Unchanged) ---
-# ... (generate_script_from_topic, generate_script_from_github, etc. remain the same) ...
-def generate_script_from_topic(topic: str) -> dict:
+def tokenize_chunks(script_chunks: List[str]) -> List[dict]:
+    """
+    Tokenizes all chunks in one processor call and moves them to the model
+    device, returning one input dict per chunk. Done before queueing so the
+    batch worker only has to stack tensors between generate calls.
+    """
+    # Pad and truncate every text to the processor's fixed max_length (256 tokens) so
+    # rows from different requests can later be stacked into one batch with torch.cat.
+    # Without truncation, token-dense chunks (CJK, code) overflow it and fail to batch.
+    inputs = processor(script_chunks, return_tensors="pt", truncation=True)
+    inputs_on_device = {key: val.to(model.device, non_blocking=True) for key, val in inputs.items()}
+    return [{key: val[i:i + 1] for key, val in inputs_on_device.items()} for i in range(len(script_chunks))]
+
+def generate_audio_batch(chunk_inputs: List[dict]) -> Tuple[torch.Tensor, List[int], Optional["torch.cuda.Event"]]:
+    """
+    Runs a single batched Bark generation over several tokenized chunks. On GPU the
+    audio is copied to pinned host memory asynchronously on copy_stream, and the
+    returned event marks when that copy is done; pass the result to
+    collect_audio_batch to get the waveforms.
+    """
+    inputs_on_device = {key: torch.cat([inputs[key] for inputs in chunk_inputs]) for key in chunk_inputs[0]}
+    inputs_on_device["history_prompt"] = voice_prompt
+    with torch.inference_mode():
+        speech_output, output_lengths = model.generate(
+            **inputs_on_device,
+            do_sample=True,
+            fine_temperature=0.4,
+            coarse_temperature=0.8,
+            # Rows that finish early must be padded with the semantic EOS token, which is
+            # what output_lengths treats as padding; the text tokenizer's pad id (0) is a
+            # real semantic token and would be counted as speech.
+            semantic_pad_token_id=model.generation_config.semantic_config["eos_token_id"],
+            return_output_lengths=True,
+        )
+        speech_output = speech_output.to(dtype=torch.float32)
+        if not speech_output.is_cuda:
+            return speech_output, output_lengths, None
+        # The lengths are already host-side ints; only the audio needs copying
+        host_audio = torch.empty(speech_output.shape, dtype=speech_output.dtype, pin_memory=True)
+        copy_stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(copy_stream):
+            host_audio.copy_(speech_output, non_blocking=True)
+            # Keep the caching allocator from reusing this buffer before the copy finishes
+            speech_output.record_stream(copy_stream)
+            copy_done = torch.cuda.Event()
+            copy_done.record(copy_stream)
+    return host_audio, output_lengths, copy_done
+
+def collect_audio_batch(audio: torch.Tensor, lengths: List[int], copy_done: Optional["torch.cuda.Event"]) -> List[np.ndarray]:
+    """
+    Waits for a batch's device-to-host copy and returns one waveform per chunk
+    with the batch padding stripped off.
+    """
+    if copy_done is not None:
+        copy_done.synchronize()
+    audio = audio.numpy()
+    # Bark returns the per-sample lengths as a plain Python list
+    return [row[:length] for row, length in zip(audio, lengths)]
+
+async def deliver_audio_batch(batch: List[tuple], batch_output: tuple):
+    """Resolves the futures of a generated batch once its audio is on the host."""
+    try:
+        audio_pieces = await asyncio.to_thread(collect_audio_batch, *batch_output)
+    except Exception as e:
+        for _, _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        return
+    for (_, _, future), audio in zip(batch, audio_pieces):
+        if not future.done():
+            future.set_result(audio)
+
+async def bark_batch_worker():
+    """
+    Single consumer of the Bark request queue. Collects chunks that arrive within
+    a short window (possibly from different requests) and runs them through the
+    model as one batch, so concurrent requests never time-slice the GPU.
+    """
+    deliveries = set()
+    while True:
+        batch = [await bark_queue.get()]
+        try:
+            while len(batch) < BARK_MAX_BATCH:
+                batch.append(await asyncio.wait_for(bark_queue.get(), timeout=BARK_MAX_BATCH_DELAY))
+        except asyncio.TimeoutError:
+            pass
+        batch = [item for item in batch if not item[2].done()]
+        if not batch:
+            continue
+        print(f"--> Generating audio for a batch of {len(batch)} chunk(s): '{batch[0][0][:80]}...'")
+        try:
+            batch_output = await asyncio.get_running_loop().run_in_executor(
+                bark_executor, generate_audio_batch, [inputs for _, inputs, _ in batch]
+            )
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        # Finish the host copy in the background so the next batch starts generating meanwhile
+        delivery = asyncio.create_task(deliver_audio_batch(batch, batch_output))
+        deliveries.add(delivery)
+        delivery.add_done_callback(deliveries.discard)
+
+async def submit_chunks(script_chunks: List[str]) -> List[asyncio.Future]:
+    """
+    Tokenizes script chunks and queues them for the Bark batch worker, returning
+    one future per chunk that resolves to that chunk's waveform.
+    """
+    loop = asyncio.get_running_loop()
+    all_inputs = await asyncio.to_thread(tokenize_chunks, script_chunks)
+    futures = []
+    for chunk, chunk_inputs in zip(script_chunks, all_inputs):
+        future = loop.create_future()
+        bark_queue.put_nowait((chunk, chunk_inputs, future))
+        futures.append(future)
+    return futures
+
+# Generated WAVs are kept in static/ for reuse; beyond this many, the least recently
+# used ones are deleted.
+AUDIO_CACHE_MAX_FILES = int(os.getenv("AUDIO_CACHE_MAX_FILES", "200"))
+_AUDIO_FILE = re.compile(r'[0-9a-f]{40}\.wav')  # sha1-named files written by /generate-audio
+
+def prune_audio_cache(directory: str = "static"):
+    """
+    Deletes the least recently used generated WAV files in directory so that at
+    most AUDIO_CACHE_MAX_FILES remain.
+    """
+    wav_files = [entry for entry in os.scandir(directory) if entry.is_file() and _AUDIO_FILE.fullmatch(entry.name)]
+    if len(wav_files) <= AUDIO_CACHE_MAX_FILES:
+        return
+    mtimes = {}
+    for entry in wav_files:
+        try:
+            mtimes[entry.path] = entry.stat().st_mtime
+        except FileNotFoundError:
+            pass  # removed by a concurrent prune since the directory was listed
+    for path in sorted(mtimes, key=mtimes.get)[:len(mtimes) - AUDIO_CACHE_MAX_FILES]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # already removed by a concurrent prune
+
+def write_audio_file(audio_pieces: List[np.ndarray], sample_rate: int, output_path: str):
+    """
+    Joins the per-chunk waveforms into one 16-bit PCM WAV at output_path, then
+    prunes old generated files. Blocking; run it in a worker thread.
+    """
+    # Write every piece straight into one pre-sized buffer instead of concatenating copies
+    full_audio = np.empty(sum(len(piece) for piece in audio_pieces), dtype=np.float32)
+    write_pos = 0
+    for piece in audio_pieces:
+        full_audio[write_pos:write_pos + len(piece)] = piece
+        write_pos += len(piece)
+    # libsndfile wraps out-of-range samples when converting to 16-bit, so clip first
+    np.clip(full_audio, -1.0, 1.0, out=full_audio)
+    # Write to a unique temporary name first so a half-written file is never served
+    tmp_path = f"{os.path.splitext(output_path)[0]}.{uuid.uuid4().hex}.tmp"
+    try:
+        sf.write(tmp_path, full_audio, sample_rate, format="WAV", subtype="PCM_16")
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    try:
+        prune_audio_cache(os.path.dirname(output_path))
+    except OSError as e:
+        # The new file is already in place, so a failed cleanup must not fail the request
+        print(f"WARNING: Failed to prune generated audio files: {e}")
+
+def wav_stream_header(sample_rate: int) -> bytes:
+    """
+    Builds a header for a mono 16-bit PCM WAV stream of unknown length. The RIFF
+    and data sizes are set to 0xFFFFFFFF, which players treat as "until EOF".
+    """
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 0xFFFFFFFF, b'WAVE',
+        b'fmt ', 16, 1, 1, sample_rate, sample_rate * 2, 2, 16,
+        b'data', 0xFFFFFFFF,
+    )
+
+def to_pcm16(audio: np.ndarray) -> bytes:
+    """Converts a float waveform in [-1, 1] to little-endian 16-bit PCM bytes."""
+    return (np.clip(audio.astype(np.float32), -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+# --- 5. CORE AI LOGIC FUNCTIONS ---
+
+# Gemini output is the slowest step of the pipeline, so identical requests are
+# answered from an in-memory LRU cache keyed on a hash of (source_type, content).
+SCRIPT_CACHE_SIZE = 512
+script_cache: "OrderedDict[str, dict]" = OrderedDict()
+# GitHub READMEs by (owner, repo) -> (etag, content), revalidated with If-None-Match.
+readme_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+# Shared HTTP client, created on startup. Redirects are followed because the GitHub
+# API answers renamed or transferred repositories with a 301.
+http_client: Optional[httpx.AsyncClient] = None
+
+async def cached_script(source_type: str, content: str, generate) -> dict:
+    """
+    Returns the cached result for (source_type, content), or awaits generate()
+    and caches what it returns.
+    """
+    key = hashlib.sha256(f"{source_type}\0{content}".encode("utf-8")).hexdigest()
+    if key in script_cache:
+        print(f"Serving cached script for source_type '{source_type}'.")
+        script_cache.move_to_end(key)
+        return script_cache[key]
+    result = await generate()
+    script_cache[key] = result
+    if len(script_cache) > SCRIPT_CACHE_SIZE:
+        script_cache.popitem(last=False)
+    return result
+
+async def fetch_github_readme(owner: str, repo: str) -> str:
+    """
+    Fetches a repository README, using a conditional GET so unchanged READMEs
+    come back as a cheap 304 that does not count against the rate limit.
+    """
+    api_url = f"https://api.github.com/repos/{owner}/{repo}/readme"
+    cached = readme_cache.get((owner, repo))
+    # The raw media type returns the README bytes directly, with no JSON/base64 wrapping
+    headers = {"Accept": "application/vnd.github.raw"}
+    if GH_TOKEN:
+        headers["Authorization"] = f"Bearer {GH_TOKEN}"
+    if cached:
+        headers["If-None-Match"] = cached[0]
+    readme_response = await http_client.get(api_url, headers=headers)
+    if cached and readme_response.status_code == 304:
+        readme_cache.move_to_end((owner, repo))
+        return cached[1]
+    readme_response.raise_for_status()
+    readme_content = readme_response.text
+    etag = readme_response.headers.get("ETag")
+    if etag:
+        readme_cache[(owner, repo)] = (etag, readme_content)
+        if len(readme_cache) > SCRIPT_CACHE_SIZE:
+            readme_cache.popitem(last=False)
+    return readme_content
+
+# Prompt templates for file uploads; filled in with str.format(file_content=...).
+CODE_TUTORIAL_PROMPT = (
+    "You are a coding instructor. Based on the provided code, generate a detailed, step-by-step YouTube tutorial script. "
+    "Explain how to build the project, the logic of the code, how to run it, and deployment considerations. "
+    "Make it clear and practical. Output only the script.\n\n--- CODE ---\n{file_content}"
+)
+TEXT_EXPLAINER_PROMPT = (
+    "You are a presenter. Based on the provided text, create an engaging and explanatory YouTube script that "
+    "summarizes and explains the key points. Output only the script.\n\n--- TEXT ---\n{file_content}"
+)
+
+async def gemini_generate(prompt: str):
+    """Runs a Gemini completion in a worker thread with the shared model."""
+    if gemini_model is None:
+        raise RuntimeError("Gemini API key not configured.")
+    return await asyncio.to_thread(gemini_model.generate_content, prompt)
+
+async def generate_script_from_topic(topic: str) -> dict:
     print(f"Generating script for topic: {topic}")
-    genai_model = genai.GenerativeModel('gemini-1.5-flash')
     prompt = (
         f"Write a detailed YouTube video script for the topic: {topic}.\n\n"
         f"**IMPORTANT INSTRUCTION:** The script must be highly practical and application-focused. "
@@ -116,7 +468,7 @@ def generate_script_from_topic(topic: str) -> dict:
         f"- Minimum 1500 words\n- Engaging intro hook\n- 4 to 5 sections focused on practical applications\n"
         f"- A summary + call to action outro\n- Conversational tone\n- Output only the script."
     )
-    response = genai_model.generate_content(prompt)
+    response = await gemini_generate(prompt)
     return {
         "script": response.text,
         "title": f"Practical Applications of {topic}",
@@ -124,23 +476,23 @@ def generate_script_from_topic(topic: str) -> dict:
         "tags": [topic, "Practical", "HowTo", "Tutorial", "Technology"]
     }
 
-def generate_script_from_github(github_url: str) -> dict:
+async def generate_script_from_github(github_url: str) -> dict:
     print(f"Generating script for GitHub URL: {github_url}")
     match = re.search(r"github\.com/([\w.-]+)/([\w.-]+)", github_url)
     if not match:
         raise ValueError("Invalid GitHub URL format.")
     owner, repo = match.groups()
-    api_url = f"https://api.github.com/repos/{owner}/{repo}/readme"
-    readme_response = requests.get(api_url)
-    readme_response.raise_for_status()
-    readme_content = base64.b64decode(readme_response.json()['content']).decode('utf-8')
-    genai_model = genai.GenerativeModel('gemini-1.5-flash')
+    readme_content = await fetch_github_readme(owner, repo)
+    # Keyed on the README itself, so an updated README produces a fresh script
+    return await cached_script("github", f"{repo}\0{readme_content}", lambda: generate_script_from_readme(repo, readme_content))
+
+async def generate_script_from_readme(repo: str, readme_content: str) -> dict:
     prompt = (
         f"You are a tech presenter. Based on the following README for the '{repo}' project, create a practical, engaging YouTube script. "
         f"Cover what problem it solves, its main features, how to get started, and potential use cases. "
         f"Make it conversational for developers. Output only the script.\n\n--- README ---\n{readme_content}"
     )
-    script_response = genai_model.generate_content(prompt)
+    script_response = await gemini_generate(prompt)
     return {
         "script": script_response.text,
         "title": f"Project Spotlight: A Deep Dive into {repo}",
@@ -157,24 +509,16 @@ def process_user_script(raw_script: str) -> dict:
         "tags": ["custom script", "tts"]
     }
 
-def generate_script_from_file(file_content: str) -> dict:
+async def generate_script_from_file(file_content: str) -> dict:
     print("Generating script from file content.")
-    genai_model = genai.GenerativeModel('gemini-1.5-flash')
     is_code = any(kw in file_content for kw in ["def ", "function", "import", "class", "const"])
     if is_code:
-        prompt = (
-            "You are a coding instructor. Based on the provided code, generate a detailed, step-by-step YouTube tutorial script. "
-            "Explain how to build the project, the logic of the code, how to run it, and deployment considerations. "
-            "Make it clear and practical. Output only the script.\n\n--- CODE ---\n{file_content}"
-        )
+        prompt = CODE_TUTORIAL_PROMPT.format(file_content=file_content)
         title = "Step-by-Step Coding Tutorial"
     else:
-        prompt = (
-            "You are a presenter. Based on the provided text, create an engaging and explanatory YouTube script that "
-            "summarizes and explains the key points. Output only the script.\n\n--- TEXT ---\n{file_content}"
-        )
+        prompt = TEXT_EXPLAINER_PROMPT.format(file_content=file_content)
         title = "Content Explained"
-    response = genai_model.generate_content(prompt)
+    response = await gemini_generate(prompt)
     return {"script": response.text, "title": title}
     
 # --- 6. FASTAPI APPLICATION SETUP & ENDPOINTS ---
@@ -194,19 +538,43 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 @app.on_event("startup")
 async def startup_event():
-    load_tts_model()
+    global bark_queue, tts_model_ready, http_client
+    http_client = httpx.AsyncClient(follow_redirects=True)
+    bark_queue = asyncio.Queue()
+    tts_model_ready = asyncio.Event()
+    app.state.bark_worker = asyncio.create_task(bark_batch_worker())
+    # Load Bark in the background so /generate-script is served while the model loads.
+    # The done callback runs on the event loop, so it is safe to set the event there.
+    tts_loading = asyncio.get_running_loop().run_in_executor(bark_executor, load_tts_model)
+    tts_loading.add_done_callback(lambda _: tts_model_ready.set())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await http_client.aclose()
+
+async def require_tts_model():
+    """
+    Raises a 503 unless the background Bark load has finished successfully,
+    waiting briefly in case it is just about to complete.
+    """
+    try:
+        await asyncio.wait_for(tts_model_ready.wait(), timeout=1.0)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="TTS model is still loading. Please try again shortly.")
+    if not model or not processor:
+        raise HTTPException(status_code=503, detail="TTS model is not available.")
 
 @app.post("/generate-script", summary="Generate a YouTube script from various sources")
 async def handle_script_generation(request: ScriptRequest):
     try:
         if request.source_type == "topic":
-            result = generate_script_from_topic(request.content)
+            result = await cached_script("topic", request.content, lambda: generate_script_from_topic(request.content))
         elif request.source_type == "github":
-            result = generate_script_from_github(request.content)
+            result = await generate_script_from_github(request.content)
         elif request.source_type == "script":
             result = process_user_script(request.content)
         elif request.source_type == "file":
-            result = generate_script_from_file(request.content)
+            result = await cached_script("file", request.content, lambda: generate_script_from_file(request.content))
         else:
             raise HTTPException(status_code=400, detail="Invalid source_type specified.")
         return result
@@ -216,35 +584,40 @@ async def handle_script_generation(request: ScriptRequest):
 
 @app.post("/generate-audio", summary="Generate audio from a provided script")
 async def handle_audio_generation(request: AudioRequest):
-    if not model or not processor:
-        raise HTTPException(status_code=503, detail="TTS model is not available.")
+    print("Starting audio generation...")
+    # STEP 1: Clean the script to remove non-speech text
+    cleaned_script = clean_script_for_tts(request.script)
+
+    # The file name is derived from the cleaned script and voice, so a repeat request
+    # reuses the existing file and concurrent requests never overwrite each other's audio
+    audio_key = hashlib.sha1(f"{VOICE_PRESET}\0{cleaned_script}".encode("utf-8")).hexdigest()
+    output_path = f"static/{audio_key}.wav"
+    try:
+        os.utime(output_path)  # mark as recently used for prune_audio_cache
+        print(f"✅ Reusing existing audio file {output_path}")
+        return {"audio_url": f"/{output_path}"}
+    except FileNotFoundError:
+        pass  # not generated yet, or just pruned by a concurrent request; generate it below
+
+    await require_tts_model()
     try:
-        print("Starting audio generation...")
-        # STEP 1: Clean the script to remove non-speech text
-        cleaned_script = clean_script_for_tts(request.script)
-        
         # STEP 2: Chunk the now-clean script
         script_chunks = text_chunker_for_bark(cleaned_script)
         
         if not script_chunks:
             raise HTTPException(status_code=400, detail="Script is empty after cleaning.")
 
-        audio_pieces = []
-        voice_preset = "v2/en_speaker_6"
-
-        for i, chunk in enumerate(script_chunks):
-            # Improved logging: shows the exact chunk being processed
-            print(f"--> Generating audio for chunk {i+1}/{len(script_chunks)}: '{chunk[:80]}...'")
-            
-            inputs = processor(chunk, voice_preset=voice_preset, return_tensors="pt")
-            inputs_on_device = {key: val.to(model.device) for key, val in inputs.items()}
-            with torch.no_grad():
-                speech_output = model.generate(**inputs_on_device, do_sample=True, fine_temperature=0.4, coarse_temperature=0.8, pad_token_id=processor.tokenizer.pad_token_id)
-            audio_pieces.append(speech_output.cpu().numpy().squeeze())
-
-        full_audio = np.concatenate(audio_pieces).astype(np.float32)
-        output_path = "static/generated_audio.wav"
-        sf.write(output_path, full_audio, model.generation_config.sample_rate)
+        # Chunks are batched with those of any concurrent requests by the Bark worker
+        futures = await submit_chunks(script_chunks)
+        try:
+            audio_pieces = await asyncio.gather(*futures)
+        finally:
+            # If a chunk failed, the worker skips the rest of this request's chunks
+            for future in futures:
+                future.cancel()
+
+        # Joining and writing a long WAV blocks for a while, so keep it off the event loop
+        await asyncio.to_thread(write_audio_file, audio_pieces, model.generation_config.sample_rate, output_path)
         
         print(f"✅ Audio file saved to {output_path}")
         return {"audio_url": f"/{output_path}"}
@@ -253,6 +626,36 @@ async def handle_audio_generation(request: AudioRequest):
         print(f"Error in /generate-audio: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate-audio/stream", summary="Stream audio for a provided script as it is generated")
+async def handle_audio_streaming(request: AudioRequest):
+    await require_tts_model()
+    print("Starting streamed audio generation...")
+    script_chunks = text_chunker_for_bark(clean_script_for_tts(request.script))
+    if not script_chunks:
+        raise HTTPException(status_code=400, detail="Script is empty after cleaning.")
+
+    try:
+        # Queue every chunk up front so batching still applies; audio is sent in script order
+        futures = await submit_chunks(script_chunks)
+    except Exception as e:
+        print(f"Error in /generate-audio/stream: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def stream_wav():
+        yield wav_stream_header(model.generation_config.sample_rate)
+        try:
+            for future in futures:
+                yield to_pcm16(await future)
+        except Exception as e:
+            # Headers are already sent at this point, so the stream just ends early
+            print(f"Error in /generate-audio/stream: {e}")
+        finally:
+            for future in futures:
+                future.cancel()
+
+    return StreamingResponse(stream_wav(), media_type="audio/wav")
+
 if __name__ == "__main__":
     print("Starting FastAPI server...")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Each worker is a separate process with its own copy of Bark, so scale with care
+    uvicorn.run("backend_api:app", host="0.0.0.0", port=8000, workers=int(os.getenv("WEB_CONCURRENCY", "1")))
\ No newline at end of file
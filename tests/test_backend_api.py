@@ -0,0 +1,335 @@
+import asyncio
+import functools
+import os
+import struct
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip("torch")
+np = pytest.importorskip("numpy")
+sf = pytest.importorskip("soundfile")
+httpx = pytest.importorskip("httpx")
+backend_api = pytest.importorskip("backend_api")
+
+
+class FakeBarkModel:
+    """Mimics BarkModel.generate(..., return_output_lengths=True) from transformers 4.43."""
+
+    device = torch.device("cpu")
+    generation_config = SimpleNamespace(semantic_config={"eos_token_id": 10_000})
+
+    def __init__(self, lengths):
+        self.lengths = lengths
+        self.calls = []
+
+    def generate(self, **kwargs):
+        self.calls.append(kwargs)
+        audio = [torch.full((length,), 0.5, dtype=torch.float16) for length in self.lengths]
+        output_lengths = [len(sample) for sample in audio]
+        padded = torch.nn.utils.rnn.pad_sequence(audio, batch_first=True, padding_value=0)
+        return padded, output_lengths
+
+
+def make_tiny_bark_model():
+    """A randomly initialised BarkModel with real vocabularies but tiny layers."""
+    from transformers import BarkConfig, BarkModel, GenerationConfig
+    from transformers.models.bark.configuration_bark import BarkCoarseConfig, BarkFineConfig, BarkSemanticConfig
+    from transformers.models.bark.generation_configuration_bark import BarkGenerationConfig
+    from transformers.models.encodec.configuration_encodec import EncodecConfig
+
+    torch.manual_seed(0)
+    tiny = dict(hidden_size=8, num_layers=1, num_heads=1, block_size=1024)
+    config = BarkConfig(
+        semantic_config=BarkSemanticConfig(input_vocab_size=129_600, output_vocab_size=10_048, **tiny).to_dict(),
+        coarse_acoustics_config=BarkCoarseConfig(input_vocab_size=12_096, output_vocab_size=12_096, **tiny).to_dict(),
+        fine_acoustics_config=BarkFineConfig(
+            input_vocab_size=1_056, output_vocab_size=1_056, n_codes_total=8, n_codes_given=1, **tiny
+        ).to_dict(),
+        codec_config=EncodecConfig(num_filters=4, hidden_size=8, upsampling_ratios=[8, 5, 4, 2]).to_dict(),
+    )
+    model = BarkModel(config).eval()
+    # from_pretrained loads the nested configs as plain dicts, which BarkModel.generate expects
+    model.generation_config = GenerationConfig.from_dict(BarkGenerationConfig().to_dict())
+    return model
+
+
+def force_semantic_eos_at(model, eos_steps):
+    """Makes row i of the semantic model emit token 586 until step eos_steps[i], then EOS."""
+    eos_token_id = model.generation_config.semantic_config["eos_token_id"]
+    forward = model.semantic.forward
+    step = 0
+
+    @functools.wraps(forward)
+    def scripted_forward(*args, **kwargs):
+        nonlocal step
+        output = forward(*args, **kwargs)
+        logits = torch.full_like(output.logits[:, -1, :], -1e4)
+        for row, eos_step in enumerate(eos_steps):
+            logits[row, eos_token_id if step >= eos_step else 586] = 1e4
+        output.logits[:, -1, :] = logits
+        step += 1
+        return output
+
+    model.semantic.forward = scripted_forward
+
+
+async def no_wait():
+    pass
+
+
+def make_chunk_inputs(count):
+    return [
+        {
+            "input_ids": torch.zeros((1, 256), dtype=torch.long),
+            "attention_mask": torch.ones((1, 256), dtype=torch.long),
+        }
+        for _ in range(count)
+    ]
+
+
+@pytest.mark.parametrize(
+    "script, expected",
+    [
+        ("**Intro:** hi", "hi"),
+        ("Narrator(V.O.): hi", "hi"),
+        ("(a # b) c", "(a"),
+        ("## Title\nWelcome back (upbeat music) to the *show*.", "Welcome back  to the show."),
+        ("Host: Line one.\n\nGuest: Line-two", "Line one.  Linetwo"),
+    ],
+)
+def test_clean_script_for_tts(script, expected):
+    assert backend_api.clean_script_for_tts(script) == expected
+
+
+def test_generate_and_collect_audio_batch_strips_padding(monkeypatch):
+    fake_model = FakeBarkModel([4, 7])
+    monkeypatch.setattr(backend_api, "model", fake_model)
+    monkeypatch.setattr(backend_api, "voice_prompt", {"semantic_prompt": torch.zeros(1)})
+
+    audio_pieces = backend_api.collect_audio_batch(*backend_api.generate_audio_batch(make_chunk_inputs(2)))
+
+    assert [len(piece) for piece in audio_pieces] == [4, 7]
+    assert all(piece.dtype == "float32" for piece in audio_pieces)
+    assert all((piece == 0.5).all() for piece in audio_pieces)
+    assert fake_model.calls[0]["input_ids"].shape == (2, 256)
+    assert fake_model.calls[0]["return_output_lengths"] is True
+
+
+def test_generate_audio_batch_strips_padding_of_chunks_that_finish_early(monkeypatch):
+    model = make_tiny_bark_model()
+    force_semantic_eos_at(model, [2, 6])
+    monkeypatch.setattr(backend_api, "model", model)
+    monkeypatch.setattr(backend_api, "voice_prompt", None)
+
+    audio_pieces = backend_api.collect_audio_batch(*backend_api.generate_audio_batch(make_chunk_inputs(2)))
+
+    # 2 and 6 semantic tokens become 3 and 9 codec frames of 320 samples each
+    assert [len(piece) for piece in audio_pieces] == [960, 2880]
+
+
+def test_write_audio_file_clips_and_leaves_no_temp_files(tmp_path):
+    output_path = str(tmp_path / ("0" * 40 + ".wav"))
+    pieces = [np.array([0.25, 1.5], dtype=np.float32), np.array([-2.0], dtype=np.float16)]
+
+    backend_api.write_audio_file(pieces, 24000, output_path)
+
+    audio, sample_rate = sf.read(output_path, dtype="int16")
+    assert sample_rate == 24000
+    # Exact scaling differs slightly between libsndfile versions; clipped samples must not wrap
+    assert 8191 <= audio[0] <= 8192
+    assert audio[1] == 32767
+    assert audio[2] <= -32767
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["0" * 40 + ".wav"]
+
+
+def test_prune_audio_cache_skips_files_removed_concurrently(tmp_path, monkeypatch):
+    names = [str(i) * 40 + ".wav" for i in range(3)]
+    for age, name in enumerate(reversed(names)):
+        (tmp_path / name).write_bytes(b"")
+        os.utime(tmp_path / name, (1000 - age, 1000 - age))
+    real_scandir = os.scandir
+
+    def scandir_racing_another_prune(path):
+        entries = list(real_scandir(path))
+        os.remove(tmp_path / names[1])  # the other prune wins after the directory is listed
+        return entries
+
+    monkeypatch.setattr(backend_api, "AUDIO_CACHE_MAX_FILES", 1)
+    monkeypatch.setattr(backend_api.os, "scandir", scandir_racing_another_prune)
+
+    backend_api.prune_audio_cache(str(tmp_path))
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [names[2]]
+
+
+def test_generate_audio_cancels_remaining_chunks_on_failure(monkeypatch):
+    futures = []
+
+    async def fake_submit_chunks(script_chunks):
+        loop = asyncio.get_running_loop()
+        futures.extend(loop.create_future() for _ in script_chunks)
+        futures[0].set_exception(RuntimeError("CUDA out of memory"))
+        return futures
+
+    monkeypatch.setattr(backend_api, "require_tts_model", no_wait)
+    monkeypatch.setattr(backend_api, "submit_chunks", fake_submit_chunks)
+    script = "First sentence here. " * 20 + "\n\n" + "Second part follows. " * 20
+
+    with pytest.raises(backend_api.HTTPException) as excinfo:
+        asyncio.run(backend_api.handle_audio_generation(backend_api.AudioRequest(script=script)))
+
+    assert excinfo.value.status_code == 500
+    assert len(futures) > 1
+    assert all(future.cancelled() for future in futures[1:])
+
+
+def test_stream_audio_reports_queueing_errors(monkeypatch):
+    async def failing_submit_chunks(script_chunks):
+        raise RuntimeError("tokenizer failed")
+
+    monkeypatch.setattr(backend_api, "require_tts_model", no_wait)
+    monkeypatch.setattr(backend_api, "submit_chunks", failing_submit_chunks)
+
+    with pytest.raises(backend_api.HTTPException) as excinfo:
+        asyncio.run(backend_api.handle_audio_streaming(backend_api.AudioRequest(script="Hello there.")))
+
+    assert excinfo.value.status_code == 500
+    assert excinfo.value.detail == "tokenizer failed"
+
+
+def test_cached_script_serves_hits_without_calling_generate(monkeypatch):
+    monkeypatch.setattr(backend_api, "script_cache", OrderedDict())
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        return {"script": "Hello."}
+
+    async def request_twice():
+        return [await backend_api.cached_script("topic", "Rust", generate) for _ in range(2)]
+
+    first, second = asyncio.run(request_twice())
+
+    assert first == second == {"script": "Hello."}
+    assert len(calls) == 1
+
+
+def test_cached_script_evicts_least_recently_used_entry(monkeypatch):
+    monkeypatch.setattr(backend_api, "script_cache", OrderedDict())
+    monkeypatch.setattr(backend_api, "SCRIPT_CACHE_SIZE", 2)
+    generated = []
+
+    def generator_for(topic):
+        async def generate():
+            generated.append(topic)
+            return {"script": topic}
+        return generate
+
+    async def request(*topics):
+        for topic in topics:
+            await backend_api.cached_script("topic", topic, generator_for(topic))
+
+    # "a" is used again before "c" arrives, so "b" is the one evicted
+    asyncio.run(request("a", "b", "a", "c", "a", "b"))
+
+    assert generated == ["a", "b", "c", "b"]
+    assert len(backend_api.script_cache) == 2
+
+
+def serve_readmes(monkeypatch, responses):
+    """Points http_client at a MockTransport that answers with responses in order."""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return responses[len(requests) - 1]
+
+    monkeypatch.setattr(backend_api, "readme_cache", OrderedDict())
+    monkeypatch.setattr(backend_api, "GH_TOKEN", None)
+    monkeypatch.setattr(backend_api, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return requests
+
+
+def test_fetch_github_readme_serves_cached_readme_on_304(monkeypatch):
+    requests = serve_readmes(monkeypatch, [
+        httpx.Response(200, text="# Demo", headers={"ETag": '"v1"'}),
+        httpx.Response(304),
+    ])
+
+    async def fetch_twice():
+        return [await backend_api.fetch_github_readme("octo", "demo") for _ in range(2)]
+
+    assert asyncio.run(fetch_twice()) == ["# Demo", "# Demo"]
+    assert "If-None-Match" not in requests[0].headers
+    assert requests[1].headers["If-None-Match"] == '"v1"'
+    assert requests[1].headers["Accept"] == "application/vnd.github.raw"
+
+
+def test_fetch_github_readme_replaces_etag_on_200(monkeypatch):
+    requests = serve_readmes(monkeypatch, [
+        httpx.Response(200, text="# Old", headers={"ETag": '"v1"'}),
+        httpx.Response(200, text="# New", headers={"ETag": '"v2"'}),
+        httpx.Response(304),
+    ])
+
+    async def fetch_three_times():
+        return [await backend_api.fetch_github_readme("octo", "demo") for _ in range(3)]
+
+    assert asyncio.run(fetch_three_times()) == ["# Old", "# New", "# New"]
+    assert backend_api.readme_cache[("octo", "demo")] == ('"v2"', "# New")
+    assert requests[2].headers["If-None-Match"] == '"v2"'
+
+
+@pytest.mark.parametrize(
+    "file_content, title, marker",
+    [
+        ("import os\nprint(os.getcwd())", "Step-by-Step Coding Tutorial", "--- CODE ---"),
+        ("Photosynthesis turns light into chemical energy.", "Content Explained", "--- TEXT ---"),
+    ],
+)
+def test_generate_script_from_file_sends_uploaded_text(monkeypatch, file_content, title, marker):
+    prompts = []
+
+    async def fake_gemini_generate(prompt):
+        prompts.append(prompt)
+        return SimpleNamespace(text="A script.")
+
+    monkeypatch.setattr(backend_api, "gemini_generate", fake_gemini_generate)
+
+    result = asyncio.run(backend_api.generate_script_from_file(file_content))
+
+    assert result == {"script": "A script.", "title": title}
+    assert prompts[0].endswith(f"{marker}\n{file_content}")
+
+
+def test_stream_audio_sends_wav_header_then_chunks_in_script_order(monkeypatch):
+    async def fake_submit_chunks(script_chunks):
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in script_chunks]
+        # Resolve later chunks first; the stream must still follow the script
+        for index, future in reversed(list(enumerate(futures))):
+            future.set_result(np.full(3, (index + 1) / 10, dtype=np.float32))
+        return futures
+
+    monkeypatch.setattr(backend_api, "require_tts_model", no_wait)
+    monkeypatch.setattr(backend_api, "submit_chunks", fake_submit_chunks)
+    monkeypatch.setattr(backend_api, "model", SimpleNamespace(generation_config=SimpleNamespace(sample_rate=24000)))
+    script = "First sentence here. " * 20 + "\n\n" + "Second part follows. " * 20
+    chunk_count = len(backend_api.text_chunker_for_bark(backend_api.clean_script_for_tts(script)))
+
+    async def read_body():
+        response = await backend_api.handle_audio_streaming(backend_api.AudioRequest(script=script))
+        assert response.media_type == "audio/wav"
+        return b"".join([part async for part in response.body_iterator])
+
+    body = asyncio.run(read_body())
+
+    assert struct.unpack('<4sI4s4sIHHIIHH4sI', body[:44]) == (
+        b'RIFF', 0xFFFFFFFF, b'WAVE', b'fmt ', 16, 1, 1, 24000, 48000, 2, 16, b'data', 0xFFFFFFFF,
+    )
+    samples = np.frombuffer(body[44:], dtype='<i2')
+    assert chunk_count > 1
+    expected = [int(np.float32((index + 1) / 10) * 32767) for index in range(chunk_count) for _ in range(3)]
+    assert samples.tolist() == expected